@@ -0,0 +1,139 @@
+import contextlib
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import types
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import openpyxl
+import pandas as pd
+import geopandas as gpd
+
+logger = logging.getLogger(__name__)
+
+# The loaders below live in their own module (and not in the Streamlit
+# scripts) so that worker processes can import them.
+
+def read_data_file(path):
+    return pd.read_excel(path, engine='openpyxl')
+
+# The workbook has no category column: each variable's cell is coloured and
+# the 'Legend' sheet names the category of every colour
+def read_metadata_categories(workbook):
+    legend = {colour_cell.fill.fgColor.rgb: label_cell.value
+              for colour_cell, label_cell in workbook['Legend'].iter_rows(min_col=1, max_col=2)
+              if label_cell.value}
+    categories = {}
+    for cell in workbook['Variables']['A'][1:]:
+        if cell.value:
+            categories[cell.value] = legend.get(cell.fill.fgColor.rgb)
+    return categories
+
+def read_metadata_file(path):
+    # Parsed once; pandas reads the sheet from the already loaded workbook
+    workbook = openpyxl.load_workbook(path, data_only=True)
+    df_meta = pd.read_excel(workbook,
+                            sheet_name='Variables', index_col='Variable', engine='openpyxl')
+    categories = read_metadata_categories(workbook)
+    df_meta['Category'] = df_meta.index.map(categories).fillna("Other variables")
+    return df_meta
+
+def read_countries_file(path):
+    return gpd.read_file(path)
+
+# Percentile rank (0-100) of every value against the other countries with data
+# for the same variable and year; missing values stay NaN
+def percentile_ranks(df):
+    return df.groupby(['variable', 'observation_year'])['value'].rank(pct=True) * 100
+
+def pivot_for_map(df):
+    transformed_data = df.pivot(index=['countryname', 'observation_year'], columns='variable', values='value')
+    transformed_data.reset_index(inplace=True)
+    return transformed_data
+
+WORKER_PROCESSES = 2
+
+# Held while a pool is in use, so only one load per server process starts
+# worker processes at a time
+_worker_pool_lock = threading.Lock()
+
+# Under `streamlit run` the running page script stands in for __main__, and a
+# spawned worker would re-run the whole app before doing any work. All workers
+# are therefore started up front, with __main__ swapped for an empty module
+# only for that moment, so that they only import this module. The pool is not
+# kept afterwards: its workers hold on to the parser memory and are only
+# needed again when the input files change.
+@contextlib.contextmanager
+def worker_pool():
+    with _worker_pool_lock:
+        pool = ProcessPoolExecutor(max_workers=WORKER_PROCESSES,
+                                   mp_context=multiprocessing.get_context("spawn"))
+        try:
+            script_main = sys.modules["__main__"]
+            sys.modules["__main__"] = types.ModuleType("__main__")
+            try:
+                # Every submit to a pool that is not full starts one more
+                # worker process before it returns
+                for _ in range(WORKER_PROCESSES):
+                    pool.submit(os.getpid)
+            finally:
+                sys.modules["__main__"] = script_main
+            yield pool
+        finally:
+            # The results are back by now, the workers exit in the background
+            pool.shutdown(wait=False)
+
+# Records, in the parent, how long after `start` the future's result was back,
+# so starting the worker and returning the frame from it are included
+def time_future(future, timings, source, start):
+    future.add_done_callback(lambda _: timings.setdefault(source, time.perf_counter() - start))
+    return future
+
+# Load the data, metadata and geometry concurrently and return them together
+# with the map pivot and the load timings (in seconds). Every source is timed
+# from the start of the load until it was ready, so the total is the slowest
+# of data + map_pivot + percentile, metadata and countries.
+def load_dataset_bundle(data_path, metadata_path, shapefile_path):
+    start = time.perf_counter()
+    timings = {}
+    # openpyxl parsing is CPU bound, so the workbooks go to separate processes;
+    # the shapefile reader releases the GIL and is fine on a thread
+    with worker_pool() as processes, ThreadPoolExecutor(max_workers=1) as threads:
+        data_future = time_future(processes.submit(read_data_file, data_path),
+                                  timings, "data", start)
+        metadata_future = time_future(processes.submit(read_metadata_file, metadata_path),
+                                      timings, "metadata", start)
+        world_future = time_future(threads.submit(read_countries_file, shapefile_path),
+                                   timings, "countries", start)
+
+        df = data_future.result()
+        # The pivot and the ranks only depend on the data file, so they
+        # overlap with whichever of the other loads is still running
+        pivot_start = time.perf_counter()
+        pivoted_data = pivot_for_map(df)
+        timings["map_pivot"] = time.perf_counter() - pivot_start
+        # Ranked once here and published with the data, instead of in every
+        # process that shows a country profile
+        rank_start = time.perf_counter()
+        df['percentile'] = percentile_ranks(df)
+        timings["percentile"] = time.perf_counter() - rank_start
+
+        df_meta = metadata_future.result()
+        world_df = world_future.result()
+
+    # The futures finish in any order, the report lists the sources in a fixed one
+    timings = {source: timings[source] for source in ["data", "map_pivot", "percentile", "metadata", "countries"]}
+    timings["total"] = time.perf_counter() - start
+    logger.info("Dataset bundle loaded: %s",
+                ", ".join(f"{source} {seconds:.2f}s" for source, seconds in timings.items()))
+
+    return {
+        "data": df,
+        "metadata": df_meta,
+        "map_data": pivoted_data,
+        "countries": world_df,
+        "timings": timings,
+    }
@@ -0,0 +1,487 @@
+"""Load generator for the RETOOL Streamlit app.
+
+Starts the app locally (or targets one that is already running), opens N
+concurrent simulated browser sessions over the Streamlit websocket protocol
+and replays a mix of map scrubbing, map animation and time series selection.
+For every step of N it reports rerun latency percentiles, throughput, server
+CPU use and resident memory. Animation playback holds the script thread on
+purpose and is reported separately from the rerun percentiles.
+
+Memory per session is the slope of the server RSS between successive steps.
+Before the baseline every interaction is run once so the shared caches are
+warm, and before each step the disconnected sessions of the previous one are
+left to expire, so neither is counted against the new sessions.
+
+Example:
+    python retool_load_test.py --sessions 1,5,10,25 --duration 60
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+import urllib.request
+from collections import defaultdict
+
+from tornado.websocket import WebSocketError, websocket_connect
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+APP_SCRIPT = "retool_multipage_app_main.py"
+MAP_PAGE = "retool_multipage_map2"
+TIMESERIES_PAGE = "retool_multipage_timeseries2"
+
+DEFAULT_MIX = "map_scrub=0.6,timeseries=0.3,animation=0.1"
+
+# A press of play holds the script thread for the whole animation, which is
+# mostly deliberate time.sleep, so it is kept out of the rerun percentiles
+HOLD_ACTIONS = {"animation_playback"}
+
+FINISHED_STATUSES = {
+    ForwardMsg.FINISHED_SUCCESSFULLY,
+    ForwardMsg.FINISHED_WITH_COMPILE_ERROR,
+    ForwardMsg.FINISHED_FRAGMENT_RUN_SUCCESSFULLY,
+}
+
+
+class SimulatedSession:
+
+    def __init__(self, url, rng, think_time, timeout):
+        self.url = url
+        self.rng = rng
+        self.think_time = think_time
+        self.timeout = timeout
+        self.connection = None
+        self.timeouts = 0
+        self.errors = 0
+        self.script_exceptions = 0
+        self.pages = {}
+        self.page_script_hash = ""
+        self.widgets = {}
+        self.widget_states = {}
+        self.message_cache = {}
+        self.latencies = defaultdict(list)
+
+    async def connect(self):
+        self.pages = {}
+        self.page_script_hash = ""
+        self.widgets = {}
+        self.widget_states = {}
+        self.message_cache = {}
+        self.connection = await asyncio.wait_for(
+            websocket_connect(self.url, subprotocols=["streamlit"], max_message_size=256 * 1024 * 1024),
+            self.timeout)
+        await self.rerun("initial_load")
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+    def read_message(self, data):
+        msg = ForwardMsg()
+        msg.ParseFromString(data)
+        # Messages already sent to this session are only referenced by hash
+        if msg.WhichOneof("type") == "ref_hash":
+            cached = self.message_cache.get(msg.ref_hash)
+            if cached is None:
+                return msg
+            cached = ForwardMsg.FromString(cached.SerializeToString())
+            cached.metadata.CopyFrom(msg.metadata)
+            return cached
+        if msg.hash:
+            self.message_cache[msg.hash] = msg
+        return msg
+
+    def handle_message(self, msg):
+        kind = msg.WhichOneof("type")
+        if kind == "new_session":
+            self.widgets = {}
+            if msg.new_session.page_script_hash:
+                self.page_script_hash = msg.new_session.page_script_hash
+        elif kind == "navigation":
+            # The default page has an empty url path, so pages are also known by name
+            self.pages = {}
+            for page in msg.navigation.app_pages:
+                for name in (page.url_pathname, page.page_name.lower().replace(" ", "_")):
+                    if name:
+                        self.pages[name] = page.page_script_hash
+            if msg.navigation.page_script_hash:
+                self.page_script_hash = msg.navigation.page_script_hash
+        elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+            element = msg.delta.new_element
+            element_type = element.WhichOneof("type")
+            if element_type == "exception":
+                self.script_exceptions += 1
+            widget = getattr(element, element_type, None) if element_type else None
+            if widget is not None and hasattr(widget, "id") and hasattr(widget, "label"):
+                # Keep the first widget with a label, e.g. the map year slider
+                # and not the disabled copies drawn during the animation
+                self.widgets.setdefault((element_type, widget.label.lower()), widget)
+        elif kind == "script_finished":
+            return msg.script_finished
+        return None
+
+    async def rerun(self, action, page_script_hash=None):
+        back_msg = BackMsg()
+        client_state = back_msg.rerun_script
+        client_state.query_string = ""
+        client_state.page_script_hash = page_script_hash or self.page_script_hash
+        client_state.widget_states.widgets.extend(self.widget_states.values())
+        # Button presses only last for a single rerun
+        self.widget_states = {widget_id: state for widget_id, state in self.widget_states.items()
+                              if state.WhichOneof("value") != "trigger_value"}
+
+        start = time.perf_counter()
+        await self.connection.write_message(back_msg.SerializeToString(), binary=True)
+        await asyncio.wait_for(self.wait_for_script_finished(), self.timeout)
+        self.latencies[action].append(time.perf_counter() - start)
+
+    async def wait_for_script_finished(self):
+        while True:
+            data = await self.connection.read_message()
+            if data is None:
+                raise ConnectionError("The server closed the session")
+            status = self.handle_message(self.read_message(data))
+            if status in FINISHED_STATUSES:
+                return
+
+    def find_widget(self, element_type, label):
+        for (widget_type, widget_label), widget in self.widgets.items():
+            if widget_type == element_type and label in widget_label:
+                return widget
+        return None
+
+    def set_widget(self, widget, value):
+        state = WidgetState(id=widget.id)
+        if isinstance(value, bool):
+            state.bool_value = value
+        elif isinstance(value, int):
+            state.int_value = value
+        elif isinstance(value, float):
+            state.double_array_value.data.append(value)
+        elif isinstance(value, str):
+            state.string_value = value
+        else:
+            state.int_array_value.data.extend(value)
+        self.widget_states[widget.id] = state
+
+    def press_button(self, widget):
+        self.widget_states[widget.id] = WidgetState(id=widget.id, trigger_value=True)
+
+    async def open_page(self, url_pathname):
+        page_script_hash = self.pages.get(url_pathname)
+        if page_script_hash is None or page_script_hash == self.page_script_hash:
+            return
+        self.widget_states = {}
+        await self.rerun("page_switch", page_script_hash)
+        self.page_script_hash = page_script_hash
+
+    async def stop_animation(self, action):
+        pause = self.find_widget("button", "❚❚")
+        if pause is not None:
+            self.press_button(pause)
+            await self.rerun(action)
+
+    async def map_scrub(self):
+        await self.open_page(MAP_PAGE)
+        await self.stop_animation("map_scrub")
+        variable = self.find_widget("selectbox", "select variable")
+        if variable is not None and self.rng.random() < 0.2:
+            self.set_widget(variable, self.rng.randrange(len(variable.options)))
+            await self.rerun("map_scrub")
+        # A scrub is a few consecutive slider moves
+        for _ in range(self.rng.randint(2, 5)):
+            year = self.find_widget("slider", "select year")
+            if year is None:
+                break
+            self.set_widget(year, float(self.rng.randint(int(year.min), int(year.max))))
+            await self.rerun("map_scrub")
+
+    async def animation(self):
+        await self.open_page(MAP_PAGE)
+        await self.stop_animation("animation")
+        year = self.find_widget("slider", "select year")
+        if year is not None:
+            self.set_widget(year, float(year.min))
+            await self.rerun("animation")
+        play = self.find_widget("button", "▶")
+        if play is not None:
+            self.press_button(play)
+            await self.rerun("animation_playback")
+
+    async def timeseries(self):
+        await self.open_page(TIMESERIES_PAGE)
+        variable = self.find_widget("selectbox", "select a variable")
+        if variable is not None:
+            self.set_widget(variable, self.rng.randrange(len(variable.options)))
+            await self.rerun("timeseries")
+        countries = self.find_widget("multiselect", "select countries")
+        if countries is not None and not countries.disabled:
+            picked = self.rng.sample(range(len(countries.options)),
+                                     k=min(len(countries.options), self.rng.randint(1, 4)))
+            self.set_widget(countries, picked)
+            await self.rerun("timeseries")
+
+    async def run(self, mix, deadline):
+        actions = list(mix)
+        weights = [mix[action] for action in actions]
+        while time.perf_counter() < deadline:
+            action = self.rng.choices(actions, weights)[0]
+            try:
+                await getattr(self, action)()
+            except (asyncio.TimeoutError, OSError, WebSocketError) as error:
+                if isinstance(error, asyncio.TimeoutError):
+                    self.timeouts += 1
+                else:
+                    self.errors += 1
+                # The session state is unknown after a failure, start a new one
+                self.close()
+                if not await self.reconnect():
+                    return
+            await asyncio.sleep(self.think_time * self.rng.uniform(0.5, 1.5))
+
+    async def reconnect(self):
+        try:
+            await self.connect()
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+        except (OSError, WebSocketError):
+            self.errors += 1
+        else:
+            return True
+        self.close()
+        return False
+
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def process_cpu_seconds(pid):
+    # Linux only: utime + stime of the server process, in clock ticks
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def process_rss_mb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def start_app(port, session_ttl):
+    command = [sys.executable, "-m", "streamlit", "run", APP_SCRIPT,
+               f"--server.port={port}",
+               "--server.headless=true",
+               "--server.enableXsrfProtection=false",
+               f"--server.disconnectedSessionTTL={session_ttl:g}",
+               "--browser.gatherUsageStats=false"]
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    health_url = f"http://localhost:{port}/_stcore/health"
+    for _ in range(120):
+        if server.poll() is not None:
+            raise RuntimeError("The Streamlit app exited during startup")
+        try:
+            with urllib.request.urlopen(health_url) as response:
+                if response.status == 200:
+                    return server
+        except OSError:
+            pass
+        time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError("The Streamlit app did not become healthy in time")
+
+
+async def warm_up(ws_url, seed, timeout):
+    client = SimulatedSession(ws_url, random.Random(seed), 0, timeout)
+    try:
+        await client.connect()
+        # Every interaction once, so the caches shared by all sessions (map
+        # years, value ranges, search index) are filled before the baseline
+        for action in ("animation", "map_scrub", "timeseries"):
+            await getattr(client, action)()
+    finally:
+        client.close()
+
+
+async def settle(ws_url, seed, session_ttl, timeout):
+    # Disconnected sessions stay in the server's session storage for the TTL
+    # and are only dropped when the next session disconnects
+    await asyncio.sleep(session_ttl + 2)
+    client = SimulatedSession(ws_url, random.Random(seed), 0, timeout)
+    try:
+        await client.connect()
+    finally:
+        client.close()
+
+
+async def run_step(ws_url, sessions, duration, think_time, mix, seed, server_pid, timeout):
+    clients = [SimulatedSession(ws_url, random.Random(seed + n), think_time, timeout)
+               for n in range(sessions)]
+    try:
+        connected = await asyncio.gather(*(client.reconnect() for client in clients))
+        active_clients = [client for client, ok in zip(clients, connected) if ok]
+        for client in clients:
+            client.latencies.clear()
+
+        cpu_start = process_cpu_seconds(server_pid) if server_pid else None
+        start = time.perf_counter()
+        await asyncio.gather(*(client.run(mix, start + duration) for client in active_clients))
+        elapsed = time.perf_counter() - start
+        cpu_end = process_cpu_seconds(server_pid) if server_pid else None
+        rss = process_rss_mb(server_pid) if server_pid else float("nan")
+    finally:
+        for client in clients:
+            client.close()
+
+    latencies = defaultdict(list)
+    for client in clients:
+        for action, values in client.latencies.items():
+            latencies[action].extend(values)
+    all_latencies = [value for action, values in latencies.items()
+                     if action not in HOLD_ACTIONS for value in values]
+    hold_times = [value for action in HOLD_ACTIONS for value in latencies.get(action, [])]
+
+    return {
+        "sessions": sessions,
+        "connected_sessions": len(active_clients),
+        "elapsed_s": elapsed,
+        "timeouts": sum(client.timeouts for client in clients),
+        "errors": sum(client.errors for client in clients),
+        "script_exceptions": sum(client.script_exceptions for client in clients),
+        "reruns": len(all_latencies),
+        "throughput_per_s": len(all_latencies) / elapsed,
+        "p50_ms": percentile(all_latencies, 50) * 1000,
+        "p95_ms": percentile(all_latencies, 95) * 1000,
+        "p99_ms": percentile(all_latencies, 99) * 1000,
+        "script_hold": {"playbacks": len(hold_times),
+                        "p50_s": percentile(hold_times, 50),
+                        "max_s": max(hold_times, default=float("nan"))},
+        "actions": {action: {"reruns": len(values),
+                             "p50_ms": percentile(values, 50) * 1000,
+                             "p95_ms": percentile(values, 95) * 1000,
+                             "p99_ms": percentile(values, 99) * 1000}
+                    for action, values in sorted(latencies.items())},
+        "cpu_percent": (cpu_end - cpu_start) / elapsed * 100 if server_pid else float("nan"),
+        "rss_mb": rss,
+    }
+
+
+def print_report(results, baseline_rss):
+    print(f"Baseline server RSS (caches warm, no sessions): {baseline_rss:.1f} MB")
+    print("MB/+sess: RSS growth per session added since the previous step")
+    header = (f"{'sessions':>8} {'reruns':>7} {'rerun/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+              f"{'p99 ms':>8} {'cpu %':>7} {'rss MB':>8} {'MB/+sess':>8} "
+              f"{'timeouts':>8} {'errors':>7} {'exceptions':>10}")
+    print(header)
+    for result in results:
+        print(f"{result['sessions']:>8} {result['reruns']:>7} {result['throughput_per_s']:>8.2f} "
+              f"{result['p50_ms']:>8.0f} {result['p95_ms']:>8.0f} {result['p99_ms']:>8.0f} "
+              f"{result['cpu_percent']:>7.0f} {result['rss_mb']:>8.1f} "
+              f"{result['rss_slope_mb_per_session']:>8.2f} "
+              f"{result['timeouts']:>8} {result['errors']:>7} {result['script_exceptions']:>10}")
+        if result["connected_sessions"] < result["sessions"]:
+            print(f"{'':>8} only {result['connected_sessions']} of {result['sessions']} sessions connected")
+        if result["script_hold"]["playbacks"]:
+            print(f"{'':>8} script thread held by {result['script_hold']['playbacks']} animation playbacks: "
+                  f"p50 {result['script_hold']['p50_s']:.1f} s  max {result['script_hold']['max_s']:.1f} s")
+        for action, stats in result["actions"].items():
+            print(f"{'':>8} {action:<18} {stats['reruns']:>6} reruns  p50 {stats['p50_ms']:.0f} ms  "
+                  f"p95 {stats['p95_ms']:.0f} ms  p99 {stats['p99_ms']:.0f} ms")
+
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(","):
+        action, weight = item.split("=")
+        if action not in ("map_scrub", "timeseries", "animation"):
+            raise argparse.ArgumentTypeError(f"Unknown interaction: '{action}'")
+        mix[action] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", default="1,5,10,25",
+                        help="comma separated numbers of concurrent sessions, one step each")
+    parser.add_argument("--duration", type=float, default=60,
+                        help="seconds of interaction per step")
+    parser.add_argument("--think-time", type=float, default=2.0,
+                        help="average pause between interactions of one session, in seconds")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"interaction weights (default: {DEFAULT_MIX})")
+    parser.add_argument("--port", type=int, default=8599,
+                        help="port for the locally started app")
+    parser.add_argument("--url",
+                        help="base URL of an already running app instead of starting one")
+    parser.add_argument("--server-pid", type=int,
+                        help="pid of the server given with --url, for CPU and memory figures")
+    parser.add_argument("--timeout", type=float, default=120,
+                        help="seconds to wait for a connection or a rerun before counting a timeout")
+    parser.add_argument("--session-ttl", type=float,
+                        help="seconds the server keeps disconnected sessions (default: 10 for the "
+                             "locally started app, Streamlit's 120 with --url)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    server = None
+    session_ttl = args.session_ttl
+    if session_ttl is None:
+        session_ttl = 120 if args.url else 10
+    if args.url:
+        base_url = args.url.rstrip("/")
+        server_pid = args.server_pid
+    else:
+        server = start_app(args.port, session_ttl)
+        base_url = f"http://localhost:{args.port}"
+        server_pid = server.pid
+    ws_url = base_url.replace("http", "ws", 1) + "/_stcore/stream"
+
+    try:
+        # Warm up once so the dataset load is not part of the first step
+        try:
+            asyncio.run(warm_up(ws_url, args.seed, args.timeout))
+            asyncio.run(settle(ws_url, args.seed, session_ttl, args.timeout))
+        except (asyncio.TimeoutError, OSError, WebSocketError) as error:
+            sys.exit(f"The app did not serve the warm-up session: {error!r}")
+        baseline_rss = process_rss_mb(server_pid) if server_pid else float("nan")
+
+        results = []
+        previous_sessions, previous_rss = 0, baseline_rss
+        for sessions in [int(n) for n in args.sessions.split(",")]:
+            if results:
+                asyncio.run(settle(ws_url, args.seed, session_ttl, args.timeout))
+            result = asyncio.run(run_step(ws_url, sessions, args.duration, args.think_time,
+                                          args.mix, args.seed, server_pid, args.timeout))
+            # Only a growing number of sessions gives a slope
+            result["rss_slope_mb_per_session"] = (
+                (result["rss_mb"] - previous_rss) / (sessions - previous_sessions)
+                if sessions > previous_sessions else float("nan"))
+            previous_sessions, previous_rss = sessions, result["rss_mb"]
+            results.append(result)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print_report(results, baseline_rss)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"baseline_rss_mb": baseline_rss, "steps": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
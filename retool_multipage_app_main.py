@@ -1,9 +1,10 @@
 import streamlit as st
-import pandas as pd
+from retool_shared_dataset import load_shared_dataset
 
 #Datafiles path definition
 data_path = "input_data/202409_climate_democracy_data_clean.xlsx"
 metadata_path = "input_data/climate_democracy_metadata_new.xlsx"
+shapefile_path = "input_data/ne_110m_admin_0_countries/ne_110m_admin_0_countries.shp"
 
 #Central page aesthetics
 st.set_page_config(page_title="Climate Democracy Data",
@@ -29,32 +30,21 @@ available below.''')
 
 st.sidebar.header('''Select a visualisation''')
 
+# Data, metadata and geometry are loaded concurrently and published once as
+# read-only Arrow files that every server process memory-maps
 @st.cache_resource(show_spinner="Fetching data from the database...")
-def load_data_file(path):
-    df = pd.read_excel(path, engine='openpyxl')
-    return df
-
-@st.cache_resource
-def load_metadata_file(path):
-    df_meta = pd.read_excel(path,
-                            sheet_name='Variables', index_col='Variable', engine='openpyxl')
-    return df_meta
-
-
-#df = load_data_file(data_path)
-#df_meta = load_metadata_file(metadata_path)
-
-def import_data_file():
-    key = "import_data"
-    if key not in st.session_state:
-        st.session_state[key] = load_data_file(data_path)
-    return st.session_state[key]
-
-def import_metadata_file():
-    key = "import_metadata"
-    if key not in st.session_state:
-        st.session_state[key] = load_metadata_file(metadata_path)
-    return st.session_state[key]
+def load_dataset(data_path, metadata_path, shapefile_path):
+    return load_shared_dataset(data_path, metadata_path, shapefile_path)
+
+def import_dataset():
+    bundle = load_dataset(data_path, metadata_path, shapefile_path)
+    st.session_state["import_data"] = bundle["data"]
+    st.session_state["import_metadata"] = bundle["metadata"]
+    st.session_state["import_map_data"] = bundle["map_data"]
+    st.session_state["import_countries"] = bundle["countries"]
+    st.session_state["import_metadata_version"] = bundle["metadata_version"]
+    st.session_state["import_dataset_version"] = bundle["version"]
+    return bundle
 
 timeseries_page = st.Page("retool_multipage_timeseries2.py")
                           #,
@@ -64,6 +54,7 @@ map_page = st.Page("retool_multipage_map2.py")
                    #,
                    #title="Interactive Map Infographic",
                    #icon="🌍")
+country_page = st.Page("retool_multipage_country_profile.py")
 
 #df = import_data_file()
 #df_meta = import_metadata_file()
@@ -75,6 +66,10 @@ st.sidebar.page_link(timeseries_page,
              label="Time Series Visualisation",
              icon="📈")
 
+st.sidebar.page_link(country_page,
+             label="Country Profile",
+             icon="📋")
+
 st.sidebar.header("Download the full dataset")
 
 with open(data_path, 'rb') as f:
@@ -85,10 +80,17 @@ with open(metadata_path, 'rb') as m:
 st.sidebar.header("Find more about RETOOL")
 st.sidebar.markdown(f"[https://retoolproject.eu/](https://retoolproject.eu/)")
 
-import_data_file()
-import_metadata_file()
+bundle = import_dataset()
+
+# Load times of the process that loaded and published the dataset: each source
+# is timed until it was ready, the map pivot and percentile ranks by themselves
+with st.sidebar.expander("Data loading times"):
+    st.caption("Seconds from the start of the load until each source was ready; "
+               "the map pivot and percentile ranks are computed after the data.")
+    for source, seconds in bundle["timings"].items():
+        st.markdown(f"{source.replace('_', ' ').capitalize()}: {seconds:.2f} s")
 
-multipage = st.navigation([map_page, timeseries_page],
+multipage = st.navigation([map_page, timeseries_page, country_page],
                           position="hidden")
 
 multipage.run()
@@ -0,0 +1,78 @@
+import streamlit as st
+import pandas as pd
+
+st.markdown('#### Country Profile')
+st.markdown('''
+Select a country to see all the variables of the dataset for it at once,
+grouped by topic. For every variable you get the latest available value,
+how the country ranks against the other countries in that year (percentile
+rank, 100 being the highest value) and a sparkline of its values over the years.
+''')
+
+df = st.session_state["import_data"]
+df_meta = st.session_state["import_metadata"]
+
+# Row positions of every country, built once so that a profile is a slice of
+# the shared data (which already holds the percentile ranks) and not a scan
+@st.cache_resource
+def country_positions(dataset_version, _data):
+    return _data.groupby('countryname', sort=False, observed=True).indices
+
+@st.cache_data
+def country_profile(dataset_version, country):
+    positions = country_positions(dataset_version, df)
+    if country not in positions:
+        return pd.DataFrame()
+    country_data = df.iloc[positions[country]][['variable', 'observation_year', 'value', 'percentile']]
+    country_data = country_data.dropna(subset=['value']).sort_values('observation_year')
+    if country_data.empty:
+        return pd.DataFrame()
+    profile = country_data.groupby('variable', observed=True).agg(
+        year=('observation_year', 'last'),
+        latest_value=('value', 'last'),
+        percentile=('percentile', 'last')
+    )
+    # Every sparkline spans the country's whole year range, with NaN for the
+    # years a variable has no value, so gaps stay visible and lines line up
+    years = range(country_data['observation_year'].min(), country_data['observation_year'].max() + 1)
+    series = country_data.pivot(index='variable', columns='observation_year', values='value')
+    profile['trend'] = series.reindex(index=profile.index, columns=years).values.tolist()
+    profile = profile.reset_index()
+    profile['variable'] = profile['variable'].astype(str)
+    profile['description'] = profile['variable'].map(df_meta['Interpretation'].to_dict()).fillna("No metadata available.")
+    profile['category'] = profile['variable'].map(df_meta['Category'].to_dict()).fillna("Other variables")
+    return profile
+
+country_value = st.selectbox("**Select a Country:**", df["countryname"].unique())
+
+if country_value:
+    profile = country_profile(st.session_state["import_dataset_version"], country_value)
+
+    if not profile.empty:
+        # Categories in the order of the metadata workbook
+        categories = list(dict.fromkeys([*df_meta['Category'], "Other variables"]))
+        for category in categories:
+            category_profile = profile[profile['category'] == category]
+            if category_profile.empty:
+                continue
+            st.markdown(f'##### {category}')
+            st.dataframe(
+                category_profile[['variable', 'description', 'year', 'latest_value', 'percentile', 'trend']],
+                column_config={
+                    "variable": st.column_config.TextColumn("Variable"),
+                    "description": st.column_config.TextColumn("Description", width="large"),
+                    "year": st.column_config.NumberColumn("Year", format="%d"),
+                    "latest_value": st.column_config.NumberColumn("Latest value"),
+                    "percentile": st.column_config.ProgressColumn("Percentile rank",
+                                                                  format="%.0f",
+                                                                  min_value=0,
+                                                                  max_value=100),
+                    "trend": st.column_config.LineChartColumn("Over the years"),
+                },
+                hide_index=True,
+                use_container_width=True
+            )
+    else:
+        st.warning('No data available for the selected country.')
+else:
+    st.warning('Please select a country.')
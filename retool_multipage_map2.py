@@ -1,8 +1,8 @@
 import streamlit as st
 import plotly.graph_objects as go
 import plotly.express as px
-import geopandas as gpd
 import time
+from retool_variable_search import variable_search_options
 
 # Streamlit Map interface
 st.markdown("#### Interactive Map: Country-Level Data Over Time")
@@ -14,20 +14,6 @@ st.markdown('''
 df = st.session_state["import_data"]
 df_meta = st.session_state["import_metadata"]
 
-# Transform data for map usage
-@st.cache_resource
-def transform_data_for_map():
-    transformed_data = df.pivot(index=['countryname', 'observation_year'], columns='variable', values='value')
-    transformed_data.reset_index(inplace=True)
-    return transformed_data
-
-# Load data from Natural Earth Data site
-@st.cache_resource
-def countries_dataset():
-    shapefile_path = 'input_data/ne_110m_admin_0_countries/ne_110m_admin_0_countries.shp'
-    world_dataframe = gpd.read_file(shapefile_path)
-    return world_dataframe
-
 @st.cache_data
 def map_metadata(variable):
     description = df_meta.loc[variable, 'Interpretation']
@@ -49,11 +35,12 @@ def map_filtered_data_per_year(year,_world_dataframe):
 
 @st.cache_data
 def get_global_min_max(data):
-    global_min_max = data.groupby('variable')['value'].agg(['min', 'max']).to_dict('index')
+    global_min_max = data.groupby('variable', observed=True)['value'].agg(['min', 'max']).to_dict('index')
     return global_min_max
 
-pivoted_data = transform_data_for_map()
-world_df = countries_dataset()
+# Map pivot and Natural Earth Data geometry are prepared by the startup loader
+pivoted_data = st.session_state["import_map_data"]
+world_df = st.session_state["import_countries"]
 global_variable_ranges = get_global_min_max(df)
 
 def start_animation():
@@ -147,7 +134,16 @@ def map_generation():
 
     with var_selectbox:
         with st.container(border=True):
-            variable_map = st.selectbox("**Select Variable:**", df["variable"].unique())
+            search_query = st.text_input("**Search Variables:**",
+                                         placeholder="e.g. environment, elections, emissions")
+            variable_options = variable_search_options(search_query,
+                                                       df["variable"].unique(),
+                                                       df_meta,
+                                                       st.session_state["import_metadata_version"])
+            if not variable_options:
+                st.caption(f"No variables match '{search_query}', showing all variables.")
+                variable_options = df["variable"].unique()
+            variable_map = st.selectbox("**Select Variable:**", variable_options)
             var_desc_map, var_source_map = map_metadata(variable_map)
             st.markdown(f'**Variable description:** {var_desc_map}')
             st.markdown(f'**Variable source:** {var_source_map}')
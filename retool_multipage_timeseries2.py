@@ -1,6 +1,8 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import altair as alt
+from retool_variable_search import variable_search_options
 
 # session state variable initialisation
 if "disable_country_selection" not in st.session_state:
@@ -12,19 +14,129 @@ Select a variable of interest to get a line plot of the values over
 the years for each selected country. You can also save the plot by
 right clicking on it and selecting "Save Image As". Similarly, you
 can download the respective dataset by hovering over the dataset and
-selecting "Download as CSV".
+selecting "Download as CSV". Switch on "Compare several variables"
+to plot a number of variables side by side in small multiples.
 ''')
 
 df = st.session_state["import_data"]
 df_meta = st.session_state["import_metadata"]
 
+# Row positions of every (variable, country) series, built once so that
+# selections are looked up instead of rescanning the whole long frame
+@st.cache_resource
+def series_positions(dataset_version, _data):
+    return _data.groupby(['variable', 'countryname'], sort=False, observed=True).indices
+
+def select_series(variables, countries):
+    positions = series_positions(st.session_state["import_dataset_version"], df)
+    selected = [positions[(variable, country)]
+                for variable in variables
+                for country in countries
+                if (variable, country) in positions]
+    if not selected:
+        return df.iloc[0:0]
+    return df.iloc[np.sort(np.concatenate(selected))]
+
+def faceted_chart(data, normalise):
+    # One shared dataset for all facets; the normalisation runs client side
+    chart = alt.Chart(data[['variable', 'countryname', 'observation_year', 'value']])
+    y_field = 'value'
+    y_title = "Value"
+    if normalise:
+        chart = chart.transform_joinaggregate(
+            var_min='min(value)',
+            var_max='max(value)',
+            groupby=['variable']
+        ).transform_calculate(
+            normalised_value='datum.var_max == datum.var_min ? 0 : '
+                             '(datum.value - datum.var_min) / (datum.var_max - datum.var_min)'
+        )
+        y_field = 'normalised_value'
+        y_title = "Normalised value (0-1)"
+
+    lines = chart.mark_line(point=True).encode(
+        x=alt.X('observation_year:O', title="Years", axis=alt.Axis(labelAngle=0)),
+        y=alt.Y(f'{y_field}:Q', title=y_title),
+        color=alt.Color('countryname:N', title="Country"),
+        tooltip=['variable:N', 'countryname:N', 'observation_year:O', 'value:Q']
+    ).properties(
+        width=280,
+        height=180
+    )
+
+    return lines.facet(
+        facet=alt.Facet('variable:N', title=None),
+        columns=2
+    ).resolve_scale(
+        y='shared' if normalise else 'independent'
+    )
+
+compare_variables = st.toggle("**Compare several variables**", value=False)
+
 var_widget, country_widget = st.columns(spec=2,
                                         gap="medium",
                                         vertical_alignment="top")
 
+if compare_variables:
+    with var_widget:
+        with st.container(border=True):
+            search_query = st.text_input("**Search Variables:**",
+                                         placeholder="e.g. environment, elections, emissions")
+            search_results = variable_search_options(search_query,
+                                                     df["variable"].unique(),
+                                                     df_meta,
+                                                     st.session_state["import_metadata_version"])
+            if not search_results:
+                st.caption(f"No variables match '{search_query}', showing all variables.")
+                search_results = df["variable"].unique()
+            # A new search changes the options and with them the widget, so the
+            # variables picked so far stay in the options and are handed to the
+            # new widget through its key
+            picked_variables = st.session_state.get("compare_variable_values", [])
+            st.session_state.compare_variable_values = picked_variables
+            variable_values = st.multiselect("**Select Variables:**",
+                                             list(dict.fromkeys([*picked_variables, *search_results])),
+                                             key="compare_variable_values")
+            normalise = st.checkbox("Normalise each variable to the 0-1 range", value=False)
+
+    with country_widget:
+        with st.container(border=True):
+            country_values = st.multiselect("**Select Countries:**",
+                                                df["countryname"].unique())
+
+    if variable_values and country_values:
+        faceted_df = select_series(variable_values, country_values)
+
+        if not faceted_df.empty:
+            st.altair_chart(faceted_chart(faceted_df, normalise))
+
+            with st.expander("Variable descriptions"):
+                for variable in variable_values:
+                    try:
+                        st.markdown(f"**{variable}:** {df_meta.loc[variable, 'Interpretation']} "
+                                    f"(Source: {df_meta.loc[variable, 'Source']})")
+                    except KeyError:
+                        st.markdown(f"**{variable}:** no metadata available.")
+
+            st.write(faceted_df.iloc[:, 1:].drop(columns='percentile'))
+        else:
+            st.warning('No data available for the selected choices.')
+    else:
+        st.warning('Please select at least one option for each category.')
+    st.stop()
+
 with var_widget:
     with st.container(border=True):
-        variable_value = st.selectbox("**Select a Variable:**", df["variable"].unique())
+        search_query = st.text_input("**Search Variables:**",
+                                     placeholder="e.g. environment, elections, emissions")
+        variable_options = variable_search_options(search_query,
+                                                   df["variable"].unique(),
+                                                   df_meta,
+                                                   st.session_state["import_metadata_version"])
+        if not variable_options:
+            st.caption(f"No variables match '{search_query}', showing all variables.")
+            variable_options = df["variable"].unique()
+        variable_value = st.selectbox("**Select a Variable:**", variable_options)
 
         try:
             var_desc = df_meta.loc[variable_value, 'Interpretation']
@@ -53,8 +165,7 @@ with country_widget:
                                             )
 
 if country_values and variable_value:
-    filtered_df = df[(df["countryname"].isin(country_values)) &
-                    (df["variable"] == variable_value)]
+    filtered_df = select_series([variable_value], country_values)
 
     if not filtered_df.empty:
         # Altair chart creation
@@ -80,7 +191,7 @@ if country_values and variable_value:
 
         st.altair_chart(chart + points, use_container_width=True) # chart and annotations combination
 
-        st.write(filtered_df.iloc[:, 1:])
+        st.write(filtered_df.iloc[:, 1:].drop(columns='percentile'))
 
     else:
         st.warning('No data available for the selected choices.')
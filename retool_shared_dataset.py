@@ -0,0 +1,151 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import geopandas as gpd
+import pyarrow as pa
+
+from retool_data_loader import load_dataset_bundle
+
+logger = logging.getLogger(__name__)
+
+# Bump when the layout of the published files changes
+FORMAT_VERSION = 3
+
+# Frames of the dataset bundle that are published as Arrow IPC files
+SHARED_FRAMES = ["data", "metadata", "map_data", "countries"]
+
+def shared_dataset_root():
+    # /dev/shm keeps the published files in RAM, so mapping them never hits the disk
+    default_root = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.environ.get("RETOOL_SHARED_DATA_DIR",
+                          os.path.join(default_root, "retool_climate_democracy"))
+
+def dataset_version(*paths):
+    digest = hashlib.sha1(str(FORMAT_VERSION).encode())
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()[:16]
+
+def frame_to_table(frame):
+    metadata = {"index": [name for name in frame.index.names if name is not None]}
+    if isinstance(frame, gpd.GeoDataFrame):
+        metadata["geometry"] = frame.geometry.name
+        metadata["crs"] = frame.crs.to_wkt() if frame.crs is not None else None
+        frame = frame.to_wkb()
+    if metadata["index"]:
+        frame = frame.reset_index()
+
+    arrays = {}
+    for name, column in frame.items():
+        if metadata.get("geometry") == name:
+            arrays[str(name)] = pa.array(column, type=pa.binary())
+        elif isinstance(column.dtype, np.dtype) and column.dtype.kind in "biufM":
+            # Built from the numpy buffer so NaN stays a float value and not a
+            # null, which keeps the column zero-copy on the way back to pandas
+            arrays[str(name)] = pa.array(column.to_numpy())
+        else:
+            # Text columns are stored once per distinct value and come back as categoricals
+            arrays[str(name)] = pa.array(column.astype("string")).dictionary_encode()
+
+    table = pa.table(arrays)
+    return table.replace_schema_metadata({"retool": json.dumps(metadata)})
+
+def table_to_frame(table):
+    metadata = json.loads(table.schema.metadata[b"retool"])
+    # split_blocks avoids consolidating the columns into new 2D blocks, so the
+    # numeric columns stay views over the memory-mapped buffers
+    frame = table.to_pandas(split_blocks=True, self_destruct=False)
+    if metadata["index"]:
+        frame = frame.set_index(metadata["index"])
+    if "geometry" in metadata:
+        geometry = gpd.GeoSeries.from_wkb(frame.pop(metadata["geometry"]), crs=metadata["crs"])
+        frame = gpd.GeoDataFrame(frame, geometry=geometry)
+    return frame
+
+def write_table(table, path):
+    # Uncompressed IPC file format, so readers can map it without decoding
+    with pa.OSFile(path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+def read_table(path):
+    with pa.memory_map(path, "r") as source:
+        return pa.ipc.open_file(source).read_all()
+
+def write_staging(bundle, root):
+    # The pid in the name tells whether the publisher is still running
+    staging = tempfile.mkdtemp(prefix=f".staging-{os.getpid()}-", dir=root)
+    try:
+        for name in SHARED_FRAMES:
+            write_table(frame_to_table(bundle[name]), os.path.join(staging, f"{name}.arrow"))
+        with open(os.path.join(staging, "timings.json"), "w") as f:
+            json.dump(bundle["timings"], f)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return staging
+
+def process_is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def remove_stale_datasets(root, current):
+    # Workers still mapping an old version keep their pages until they unmap
+    for entry in os.listdir(root):
+        if entry.startswith("dataset_") and entry != current:
+            shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
+        elif entry.startswith(".staging-"):
+            # Left behind by a publisher that crashed or was killed mid-write
+            pid = entry.split("-")[1]
+            if pid.isdigit() and int(pid) != os.getpid() and not process_is_running(int(pid)):
+                shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
+
+def map_dataset(directory):
+    bundle = {name: table_to_frame(read_table(os.path.join(directory, f"{name}.arrow")))
+              for name in SHARED_FRAMES}
+    with open(os.path.join(directory, "timings.json")) as f:
+        bundle["timings"] = json.load(f)
+    return bundle
+
+# Load the dataset bundle through the shared, read-only Arrow files. A worker
+# process that finds no published files loads and publishes them, every other
+# worker (and every later start with unchanged input files) only maps them.
+def load_shared_dataset(data_path, metadata_path, shapefile_path):
+    root = shared_dataset_root()
+    os.makedirs(root, exist_ok=True)
+    # The metadata version is part of the name, so it always describes the
+    # metadata that is actually mapped below
+    metadata_version = dataset_version(metadata_path)
+    name = f"dataset_{dataset_version(data_path, shapefile_path)}_{metadata_version}"
+    directory = os.path.join(root, name)
+
+    if not os.path.isdir(directory):
+        # The load itself runs without the lock; workers starting together may
+        # each load, but only the first one publishes
+        staging = write_staging(load_dataset_bundle(data_path, metadata_path, shapefile_path), root)
+        with open(os.path.join(root, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if os.path.isdir(directory):
+                shutil.rmtree(staging, ignore_errors=True)
+            else:
+                # Readers only ever see a complete directory
+                os.rename(staging, directory)
+                logger.info("Published shared dataset to %s", directory)
+            remove_stale_datasets(root, name)
+
+    bundle = map_dataset(directory)
+    bundle["version"] = name
+    bundle["metadata_version"] = metadata_version
+    return bundle
@@ -0,0 +1,84 @@
+import bisect
+import re
+from collections import defaultdict
+
+import streamlit as st
+import pandas as pd
+
+# Metadata fields that are indexed and how much a match in each one counts
+FIELD_WEIGHTS = {"Variable": 3.0, "Interpretation": 2.0, "Source": 1.0}
+# A query term that is only a prefix of an indexed term counts for less
+PREFIX_WEIGHT = 0.5
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+# Query words keep their underscores so that codes can be typed as they are
+QUERY_PATTERN = re.compile(r"[a-z0-9_]+")
+PART_PATTERN = re.compile(r"[a-z]+|[0-9]+")
+
+def tokenise(text):
+    tokens = WORD_PATTERN.findall(str(text).lower())
+    # Variable codes such as min_per501 are also split into their letter and
+    # digit parts, so that "per" or "501" find them as well
+    parts = [part for token in tokens for part in PART_PATTERN.findall(token) if part != token]
+    return tokens + parts
+
+class VariableSearchIndex:
+
+    def __init__(self, variables, df_meta):
+        self.variables = list(variables)
+        postings = defaultdict(lambda: defaultdict(float))
+        for position, variable in enumerate(self.variables):
+            # The whole code is a term too, so "min_per501" matches itself exactly
+            fields = {"Variable": set(tokenise(variable)) | {str(variable).lower()}}
+            if variable in df_meta.index:
+                for field in ["Interpretation", "Source"]:
+                    text = df_meta.loc[variable, field]
+                    if pd.notna(text):
+                        fields[field] = set(tokenise(text))
+            for field, tokens in fields.items():
+                for token in tokens:
+                    postings[token][position] += FIELD_WEIGHTS[field]
+        self.postings = {token: dict(scores) for token, scores in postings.items()}
+        # Sorted vocabulary, so all terms sharing a prefix form one contiguous range
+        self.terms = sorted(self.postings)
+
+    def term_scores(self, query_term):
+        scores = defaultdict(float)
+        # Terms starting with the query term sort between it and query_term + U+FFFF
+        start = bisect.bisect_left(self.terms, query_term)
+        end = bisect.bisect_left(self.terms, query_term + "\uffff", start)
+        for index in range(start, end):
+            term = self.terms[index]
+            weight = 1.0 if term == query_term else PREFIX_WEIGHT
+            for position, score in self.postings[term].items():
+                scores[position] = max(scores[position], score * weight)
+        return scores
+
+    def search(self, query):
+        query_terms = list(dict.fromkeys(QUERY_PATTERN.findall(query.lower())))
+        if not query_terms:
+            return self.variables
+
+        # Every query term has to match, either fully or as a prefix
+        results = None
+        for query_term in query_terms:
+            scores = self.term_scores(query_term)
+            if results is None:
+                results = dict(scores)
+            else:
+                results = {position: results[position] + score
+                           for position, score in scores.items() if position in results}
+            if not results:
+                return []
+
+        ranked = sorted(results, key=lambda position: (-results[position], position))
+        return [self.variables[position] for position in ranked]
+
+# Built once per metadata version and shared by all sessions
+@st.cache_resource
+def variable_search_index(metadata_version, variables, _df_meta):
+    return VariableSearchIndex(variables, _df_meta)
+
+def variable_search_options(query, variables, df_meta, metadata_version):
+    index = variable_search_index(metadata_version, tuple(variables), df_meta)
+    return index.search(query)